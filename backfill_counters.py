@@ -0,0 +1,25 @@
+"""
+Counter Backfill
+
+One-off job that fills post_count/comment_count on topics and posts created
+before those counters existed. A no-op once every parent has its counter.
+Usage: python backfill_counters.py
+"""
+
+import asyncio
+
+from database import database_name, create_client, backfill_counters
+
+async def main():
+    client = create_client()
+    if client is None:
+        print("Database not configured, nothing to backfill")
+        return
+    try:
+        backfilled = await backfill_counters(client[database_name])
+    finally:
+        client.close()
+    print(f"Backfilled counters on: {', '.join(backfilled)}" if backfilled else "Counters already up to date")
+
+if __name__ == "__main__":
+    asyncio.run(main())
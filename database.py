@@ -5,28 +5,103 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel
+from pymongo.errors import BulkWriteError
+import asyncio
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Tuple, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
 load_dotenv()
 
-_client = None
-db = None
-
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+# Every worker process opens its own pool, so the connection budget for the
+# whole server (MONGO_POOL_BUDGET) is split across WEB_CONCURRENCY workers;
+# gunicorn_conf.py exports WEB_CONCURRENCY, a plain uvicorn run is one worker.
+# MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE override the per-worker values.
+web_concurrency = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+pool_budget = int(os.getenv("MONGO_POOL_BUDGET", 100))
+max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", max(1, pool_budget // web_concurrency)))
+min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", min(2, max_pool_size)))
+
+# Client settings (connection pool, compression), applied per worker process
+CLIENT_OPTIONS = {
+    "maxPoolSize": max_pool_size,
+    "minPoolSize": min_pool_size,
+    "waitQueueTimeoutMS": 2000,
+    "serverSelectionTimeoutMS": 3000,
+    # Wire compression for the text-heavy list payloads; zlib is the fallback
+    # when the server doesn't offer zstd
+    "compressors": os.getenv("MONGO_COMPRESSORS", "zstd,zlib"),
+    "zlibCompressionLevel": -1,
+}
+
+def create_client():
+    """Create a pooled MongoDB client, or None if the database is not configured"""
+    if not (database_url and database_name):
+        return None
+    return AsyncIOMotorClient(database_url, **CLIENT_OPTIONS)
+
+# Indexes matching the list query shapes (equality filter, then newest-first
+# sort), so each list is an IXSCAN with no in-memory SORT stage
+INDEXES = {
+    "topic": [IndexModel([("updated_at", -1)])],
+    "post": [IndexModel([("topic_id", 1), ("updated_at", -1)])],
+    "comment": [IndexModel([("post_id", 1), ("updated_at", -1)])],
+}
+
+async def ensure_indexes(db):
+    """Create the indexes used by the list endpoints (idempotent, safe on every boot)"""
+    if db is None:
+        return
+    await asyncio.gather(*(
+        db[collection_name].create_indexes(models)
+        for collection_name, models in INDEXES.items()
+    ))
+
+# Denormalized child counters: (child collection, parent key, parent collection, counter)
+COUNTERS = [
+    ("post", "topic_id", "topic", "post_count"),
+    ("comment", "post_id", "post", "comment_count"),
+]
+
+async def backfill_counters(db) -> List[str]:
+    """Recount children for parents created before their counter existed.
+
+    Skips any parent collection where every document already has the counter,
+    so it is cheap to re-run. Returns the parent collections it rewrote.
+    """
+    if db is None:
+        return []
+    backfilled = []
+    for child, parent_key, parent, counter in COUNTERS:
+        if await db[parent].find_one({counter: {"$exists": False}}, {"_id": 1}) is None:
+            continue
+        # Count children per parent server-side and write the totals back
+        await db[child].aggregate([
+            {"$group": {"_id": f"${parent_key}", "n": {"$sum": 1}}},
+            # Parent keys edited into something that isn't an ObjectId become
+            # null rather than aborting the whole aggregation
+            {"$project": {
+                "_id": {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}},
+                counter: "$n",
+            }},
+            {"$match": {"_id": {"$ne": None}}},
+            {"$merge": {"into": parent, "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+        ]).to_list(length=None)
+        # Parents without any children
+        await db[parent].update_many({counter: {"$exists": False}}, {"$set": {counter: 0}})
+        backfilled.append(parent)
+    return backfilled
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(db, collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -37,19 +112,46 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    # Every document gets both timestamps from one clock read, so updated_at
+    # (the list sort key) is always present and never precedes created_at
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(db, collection_name: str, items: List[dict]) -> Tuple[List[str], List[int]]:
+    """Insert many documents with timestamps in one unordered batch.
+
+    Returns the ids of the stored documents and the indexes of the items that
+    failed; an unordered insert keeps going past individual failures.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = [{**item, 'created_at': now, 'updated_at': now} for item in items]
+
+    try:
+        await db[collection_name].insert_many(docs, ordered=False)
+        failed = []
+    except BulkWriteError as e:
+        failed = sorted({err["index"] for err in e.details.get("writeErrors", [])})
+    # insert_many stamps _id onto each dict before sending
+    skip = set(failed)
+    ids = [str(doc["_id"]) for i, doc in enumerate(docs) if i not in skip]
+    return ids, failed
+
+async def get_documents(db, collection_name: str, filter_dict: dict = None, limit: int = None, sort: list = None, projection: dict = None):
+    """Get documents from collection, optionally sorted and projected server-side"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
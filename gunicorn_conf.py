@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration
+
+Runs the FastAPI app under Uvicorn workers, one event loop per process.
+Usage: gunicorn -c gunicorn_conf.py main:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+# Each worker holds its own MongoDB pool; database.py divides
+# MONGO_POOL_BUDGET by this value, so total connections stay within budget
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+keepalive = 5
@@ -1,51 +1,170 @@
 import os
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from fastapi import FastAPI, HTTPException, Request, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse
+import msgspec
+from datetime import datetime
+from typing import Annotated, List, Optional, Tuple
 from bson import ObjectId
-from datetime import datetime, timezone
+import orjson
+from pymongo import ReturnDocument, UpdateOne
 
-from database import db, create_document, get_documents
+from database import database_name, create_client, create_document, create_documents, get_documents, ensure_indexes
 
-app = FastAPI(title="Bioethics Forum API")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client = create_client()
+    app.state.db = client[database_name] if client is not None else None
+    if app.state.db is not None:
+        try:
+            await ensure_indexes(app.state.db)
+        except Exception as e:
+            # Serve without the indexes rather than refusing to boot
+            logger.warning("Could not create indexes: %s", e)
+    yield
+    if client is not None:
+        client.close()
+
+class ORJSONDefaultResponse(ORJSONResponse):
+    """orjson-backed response; values orjson can't encode natively (ObjectId) are stringified"""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=str)
+
+app = FastAPI(title="Bioethics Forum API", lifespan=lifespan, default_response_class=ORJSONDefaultResponse)
+
+# FRONTEND_ORIGIN is a comma-separated list of allowed origins. Browsers reject
+# credentials with a wildcard origin anyway, so credentials are only enabled
+# once the origins are pinned.
+frontend_origins = [o.strip() for o in os.getenv("FRONTEND_ORIGIN", "").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=frontend_origins or ["*"],
+    allow_credentials=bool(frontend_origins),
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
-# Pydantic request models
-class TopicCreate(BaseModel):
+# Request models, decoded straight from the JSON body by msgspec
+class TopicCreate(msgspec.Struct):
     title: str
     prompt: str
     author: Optional[str] = None
 
-class PostCreate(BaseModel):
+class PostCreate(msgspec.Struct):
     topic_id: str
     content: str
     author: Optional[str] = None
 
-class CommentCreate(BaseModel):
+class PostBulk(msgspec.Struct):
+    items: Annotated[List[PostCreate], msgspec.Meta(min_length=1, max_length=500)]
+
+class CommentCreate(msgspec.Struct):
     post_id: str
     content: str
     author: Optional[str] = None
 
-class VoteAction(BaseModel):
+class VoteAction(msgspec.Struct):
     vote: str  # "agree" | "disagree"
 
-class LikeAction(BaseModel):
+class LikeAction(msgspec.Struct):
     action: str  # "like"
 
+# Response models: every response row has the same fields in the same order
+class TopicOut(msgspec.Struct):
+    id: str
+    title: str
+    prompt: str
+    author: Optional[str] = None
+    agree_count: int = 0
+    disagree_count: int = 0
+    post_count: int = 0
+    updated_at: Optional[datetime] = None
+
+class PostOut(msgspec.Struct):
+    id: str
+    topic_id: str
+    content: str
+    author: Optional[str] = None
+    like_count: int = 0
+    comment_count: int = 0
+    updated_at: Optional[datetime] = None
+
+class CommentOut(msgspec.Struct):
+    id: str
+    post_id: str
+    content: str
+    author: Optional[str] = None
+    like_count: int = 0
+    updated_at: Optional[datetime] = None
+
+# Documents can be edited directly in the database viewer, so conversion is lax
+# (e.g. a counter stored as 1.0 is accepted) and a document that still doesn't
+# fit its model is logged instead of failing the whole response.
+def _convert(data, type_):
+    return msgspec.to_builtins(msgspec.convert(data, type_, strict=False), builtin_types=(datetime,))
+
+def shape(doc: dict, model):
+    """Coerce one document into `model`; if it doesn't fit, log it and return it as stored"""
+    try:
+        return _convert(doc, model)
+    except msgspec.ValidationError as e:
+        logger.warning("Malformed %s document %s: %s", model.__name__, doc.get("id"), e)
+        return doc
+
+def shape_rows(docs: List[dict], model) -> List[dict]:
+    """Coerce documents into `model` rows in field order; rows that don't fit are logged and skipped"""
+    try:
+        return _convert(docs, List[model])
+    except msgspec.ValidationError:
+        rows = []
+        for doc in docs:
+            try:
+                rows.append(_convert(doc, model))
+            except msgspec.ValidationError as e:
+                logger.warning("Skipping malformed %s document %s: %s", model.__name__, doc.get("id"), e)
+        return rows
+
+def json_body(model):
+    """Dependency that decodes the request body into `model`, answering 422 on bad input"""
+    decoder = msgspec.json.Decoder(model)
+
+    async def dependency(request: Request):
+        try:
+            return decoder.decode(await request.body())
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    return dependency
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Bioethics Forum Backend Running"}
 
+# /test is scraped by health checks; only re-run listCollections once the
+# cached result is older than the TTL
+COLLECTIONS_TTL = 30
+_collections_cache = {"ts": None, "collections": []}
+
+async def _list_collections(db) -> List[str]:
+    now = time.monotonic()
+    ts = _collections_cache["ts"]
+    if ts is None or now - ts >= COLLECTIONS_TTL:
+        _collections_cache["collections"] = await db.list_collection_names()
+        _collections_cache["ts"] = now
+    return _collections_cache["collections"]
+
 @app.get("/test")
-def test_database():
+async def test_database(request: Request):
+    db = request.app.state.db
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -62,7 +181,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await _list_collections(db)
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -79,122 +198,274 @@ def test_database():
 
 # Utility
 
+def get_db(request: Request):
+    db = request.app.state.db
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not available")
+    return db
+
+NEWEST_FIRST = [("updated_at", -1)]
+
+# Fields returned by the list/vote/like endpoints; the server renders _id as a string "id"
+# so the documents come back ready to serialize
+ID_AS_STR = {"_id": 0, "id": {"$toString": "$_id"}}
+TOPIC_LIST_FIELDS = {**ID_AS_STR, "title": 1, "prompt": 1, "author": 1, "agree_count": 1, "disagree_count": 1, "post_count": 1, "updated_at": 1}
+POST_LIST_FIELDS = {**ID_AS_STR, "topic_id": 1, "content": 1, "author": 1, "like_count": 1, "comment_count": 1, "updated_at": 1}
+COMMENT_LIST_FIELDS = {**ID_AS_STR, "post_id": 1, "content": 1, "author": 1, "like_count": 1, "updated_at": 1}
+
+# Hot list reads are cached per worker for LIST_CACHE_TTL seconds; concurrent
+# misses on the same key wait for a single query instead of each hitting the
+# database. Writes clear the affected keys in the worker that handled them;
+# other workers, clients and CDNs may serve the previous body for the window.
+LIST_CACHE_TTL = 5
+LIST_CACHE_SIZE = 1024
+_list_cache: "OrderedDict[tuple, tuple[float, bytes]]" = OrderedDict()
+
+class _Flight:
+    """Per-key lock plus the number of tasks currently using it"""
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+_list_flights: "dict[tuple, _Flight]" = {}
+
+def invalidate_lists(*keys: tuple):
+    """Forget cached list bodies after a write so this worker serves fresh data"""
+    for key in keys:
+        _list_cache.pop(key, None)
+
+def _fresh(entry) -> bool:
+    return entry is not None and time.monotonic() - entry[0] < LIST_CACHE_TTL
+
+async def cached_list(key: tuple, load, model) -> Response:
+    entry = _list_cache.get(key)
+    if not _fresh(entry):
+        if entry is not None:
+            # Expired bodies are dropped as soon as they are seen
+            del _list_cache[key]
+        flight = _list_flights.get(key)
+        if flight is None:
+            flight = _list_flights[key] = _Flight()
+        flight.users += 1
+        try:
+            async with flight.lock:
+                entry = _list_cache.get(key)
+                if not _fresh(entry):
+                    body = ORJSONDefaultResponse(shape_rows(await load(), model)).body
+                    entry = (time.monotonic(), body)
+                    _list_cache[key] = entry
+                    _list_cache.move_to_end(key)
+                    # Entries are ordered by store time, so expired ones sit
+                    # at the front; sweep them along with any LRU overflow
+                    while _list_cache:
+                        oldest = next(iter(_list_cache.values()))
+                        if _fresh(oldest) and len(_list_cache) <= LIST_CACHE_SIZE:
+                            break
+                        _list_cache.popitem(last=False)
+        finally:
+            # The lock stays registered while anyone is waiting on it, so a
+            # failed load is retried by one waiter at a time rather than by
+            # every new arrival in parallel
+            flight.users -= 1
+            if flight.users == 0 and _list_flights.get(key) is flight:
+                del _list_flights[key]
+    return Response(
+        content=entry[1],
+        media_type="application/json",
+        headers={"Cache-Control": f"public, max-age={LIST_CACHE_TTL}"},
+    )
+
+@lru_cache(maxsize=4096)
+def _objectid_from_bytes(raw: bytes) -> ObjectId:
+    """Build an ObjectId from validated raw bytes; popular ids are served from the cache"""
+    # Building from the raw 12 bytes skips ObjectId's own hex validation
+    return ObjectId(raw)
+
 def ensure_objectid(id_str: str) -> ObjectId:
+    # Reject malformed ids before the cache so junk ids never take a slot;
+    # bytes.fromhex is a C-level hex check
+    if len(id_str) != 24:
+        raise HTTPException(status_code=400, detail="Invalid ID")
     try:
-        return ObjectId(id_str)
-    except Exception:
+        raw = bytes.fromhex(id_str)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid ID")
+    if len(raw) != 12:  # fromhex tolerates whitespace
+        raise HTTPException(status_code=400, detail="Invalid ID")
+    return _objectid_from_bytes(raw)
+
+async def create_child(db, parent_collection: str, parent_oid: ObjectId, counter: str,
+                       collection_name: str, data: dict, not_found: str,
+                       parent_fields: Optional[dict] = None) -> Tuple[str, dict]:
+    """Insert a child document and bump its parent's counter in one round-trip.
+
+    Both writes are sent concurrently; the counter $inc doubles as the parent
+    existence check. If the parent is missing (or the bump fails) the orphaned
+    child is deleted; if the insert fails the bump is undone. Returns the new
+    id and the parent document, projected to `parent_fields`.
+    """
+    bumped, inserted = await asyncio.gather(
+        db[parent_collection].find_one_and_update(
+            {"_id": parent_oid}, {"$inc": {counter: 1}}, projection=parent_fields or {"_id": 1}
+        ),
+        create_document(db, collection_name, data),
+        return_exceptions=True,
+    )
+    if isinstance(bumped, BaseException) or bumped is None:
+        if not isinstance(inserted, BaseException):
+            await db[collection_name].delete_one({"_id": ObjectId(inserted)})
+        if isinstance(bumped, BaseException):
+            raise bumped
+        raise HTTPException(status_code=404, detail=not_found)
+    if isinstance(inserted, BaseException):
+        await db[parent_collection].update_one({"_id": parent_oid}, {"$inc": {counter: -1}})
+        raise inserted
+    return inserted, bumped
 
 # Endpoints
 
 @app.post("/api/topics")
-def create_topic(payload: TopicCreate):
+async def create_topic(payload: TopicCreate = Depends(json_body(TopicCreate)), db=Depends(get_db)):
     data = {
         "title": payload.title,
         "prompt": payload.prompt,
         "author": payload.author,
         "agree_count": 0,
         "disagree_count": 0,
+        "post_count": 0,
     }
-    new_id = create_document("topic", data)
+    new_id = await create_document(db, "topic", data)
+    invalidate_lists(("topics",))
     return {"id": new_id}
 
 @app.get("/api/topics")
-def list_topics():
-    docs = get_documents("topic", {}, limit=100)
-    # Convert ObjectId to str
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    # sort by updated_at desc
-    docs.sort(key=lambda x: x.get("updated_at"), reverse=True)
-    return docs
+async def list_topics(db=Depends(get_db)):
+    return await cached_list(
+        ("topics",),
+        lambda: get_documents(db, "topic", {}, limit=100, sort=NEWEST_FIRST, projection=TOPIC_LIST_FIELDS),
+        TopicOut,
+    )
 
 @app.post("/api/topics/{topic_id}/vote")
-def vote_topic(topic_id: str, payload: VoteAction):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not available")
+async def vote_topic(topic_id: str, payload: VoteAction = Depends(json_body(VoteAction)), db=Depends(get_db)):
     if payload.vote not in ("agree", "disagree"):
         raise HTTPException(status_code=400, detail="Invalid vote")
     oid = ensure_objectid(topic_id)
     inc_field = "agree_count" if payload.vote == "agree" else "disagree_count"
-    # Use application-side timestamp to avoid serverStatus permission issues
-    now = datetime.now(timezone.utc)
-    res = db["topic"].update_one(
+    # Let the server stamp updated_at within the same update op
+    doc = await db["topic"].find_one_and_update(
         {"_id": oid},
-        {"$inc": {inc_field: 1}, "$set": {"updated_at": now}}
+        {"$inc": {inc_field: 1}, "$currentDate": {"updated_at": True}},
+        projection=TOPIC_LIST_FIELDS,
+        return_document=ReturnDocument.AFTER,
     )
-    if res.matched_count == 0:
+    if doc is None:
         raise HTTPException(status_code=404, detail="Topic not found")
-    doc = db["topic"].find_one({"_id": oid})
-    doc["id"] = str(doc.pop("_id"))
-    return doc
+    invalidate_lists(("topics",))
+    return ORJSONDefaultResponse(shape(doc, TopicOut))
 
 @app.post("/api/posts")
-def create_post(payload: PostCreate):
-    # ensure topic exists
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not available")
+async def create_post(payload: PostCreate = Depends(json_body(PostCreate)), db=Depends(get_db)):
     oid = ensure_objectid(payload.topic_id)
-    if db["topic"].count_documents({"_id": oid}) == 0:
-        raise HTTPException(status_code=404, detail="Topic not found")
     data = {
         "topic_id": str(oid),
         "content": payload.content,
         "author": payload.author,
         "like_count": 0,
+        "comment_count": 0,
     }
-    new_id = create_document("post", data)
+    new_id, _ = await create_child(db, "topic", oid, "post_count", "post", data, "Topic not found")
+    invalidate_lists(("topics",), ("posts", str(oid)))
     return {"id": new_id}
 
+async def bump_post_counts(db, per_topic: Counter):
+    """Add each topic's number of newly inserted posts to its post_count"""
+    if per_topic:
+        await db["topic"].bulk_write(
+            [UpdateOne({"_id": oid}, {"$inc": {"post_count": n}}) for oid, n in per_topic.items()],
+            ordered=False,
+        )
+
+@app.post("/api/posts/bulk")
+async def create_posts_bulk(payload: PostBulk = Depends(json_body(PostBulk)), db=Depends(get_db)):
+    oids = [ensure_objectid(item.topic_id) for item in payload.items]
+    per_topic = Counter(oids)
+    # ensure every topic exists with a single $in lookup
+    found = await db["topic"].find({"_id": {"$in": list(per_topic)}}, {"_id": 1}).to_list(length=None)
+    if len(found) != len(per_topic):
+        raise HTTPException(status_code=404, detail="Topic not found")
+    items = [
+        {
+            "topic_id": str(oid),
+            "content": item.content,
+            "author": item.author,
+            "like_count": 0,
+            "comment_count": 0,
+        }
+        for oid, item in zip(oids, payload.items)
+    ]
+    # Bump the counters only after the insert, and only for the posts that
+    # actually landed; an unordered insert can fail partway through
+    new_ids, failed = await create_documents(db, "post", items)
+    skip = set(failed)
+    inserted = Counter(oid for i, oid in enumerate(oids) if i not in skip)
+    await bump_post_counts(db, inserted)
+    invalidate_lists(("topics",), *(("posts", str(oid)) for oid in inserted))
+    body = {"ids": new_ids, "failed": failed}
+    if failed:
+        # Tell the client exactly what landed so a retry only resends the failures
+        return ORJSONDefaultResponse(body, status_code=207 if new_ids else 409)
+    return body
+
 @app.get("/api/topics/{topic_id}/posts")
-def list_posts(topic_id: str):
-    docs = get_documents("post", {"topic_id": topic_id}, limit=200)
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    docs.sort(key=lambda x: x.get("updated_at"), reverse=True)
-    return docs
+async def list_posts(topic_id: str, db=Depends(get_db)):
+    return await cached_list(
+        ("posts", topic_id),
+        lambda: get_documents(db, "post", {"topic_id": topic_id}, limit=200, sort=NEWEST_FIRST, projection=POST_LIST_FIELDS),
+        PostOut,
+    )
 
 @app.post("/api/posts/{post_id}/like")
 
-def like_post(post_id: str, payload: LikeAction):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not available")
+async def like_post(post_id: str, payload: LikeAction = Depends(json_body(LikeAction)), db=Depends(get_db)):
     if payload.action != "like":
         raise HTTPException(status_code=400, detail="Invalid action")
     oid = ensure_objectid(post_id)
-    now = datetime.now(timezone.utc)
-    res = db["post"].update_one({"_id": oid}, {"$inc": {"like_count": 1}, "$set": {"updated_at": now}})
-    if res.matched_count == 0:
+    doc = await db["post"].find_one_and_update(
+        {"_id": oid},
+        {"$inc": {"like_count": 1}, "$currentDate": {"updated_at": True}},
+        projection=POST_LIST_FIELDS,
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    doc = db["post"].find_one({"_id": oid})
-    doc["id"] = str(doc.pop("_id"))
-    return doc
+    invalidate_lists(("posts", doc["topic_id"]))
+    return ORJSONDefaultResponse(shape(doc, PostOut))
 
 @app.post("/api/comments")
-def create_comment(payload: CommentCreate):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not available")
+async def create_comment(payload: CommentCreate = Depends(json_body(CommentCreate)), db=Depends(get_db)):
     poid = ensure_objectid(payload.post_id)
-    if db["post"].count_documents({"_id": poid}) == 0:
-        raise HTTPException(status_code=404, detail="Post not found")
     data = {
         "post_id": str(poid),
         "content": payload.content,
         "author": payload.author,
         "like_count": 0,
     }
-    new_id = create_document("comment", data)
+    new_id, post = await create_child(
+        db, "post", poid, "comment_count", "comment", data, "Post not found", parent_fields={"topic_id": 1}
+    )
+    # comment_count is served from the cached post list of the parent topic
+    invalidate_lists(("posts", post.get("topic_id")))
     return {"id": new_id}
 
 @app.get("/api/posts/{post_id}/comments")
-def list_comments(post_id: str):
-    docs = get_documents("comment", {"post_id": post_id}, limit=200)
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    docs.sort(key=lambda x: x.get("updated_at"), reverse=True)
-    return docs
+async def list_comments(post_id: str, db=Depends(get_db)):
+    docs = await get_documents(db, "comment", {"post_id": post_id}, limit=200, sort=NEWEST_FIRST, projection=COMMENT_LIST_FIELDS)
+    return ORJSONDefaultResponse(shape_rows(docs, CommentOut))
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop", http="httptools")
@@ -49,6 +49,7 @@ class Topic(BaseModel):
     author: Optional[str] = Field(None, description="Display name of topic creator")
     agree_count: int = Field(0, ge=0, description="Number of users who agree")
     disagree_count: int = Field(0, ge=0, description="Number of users who disagree")
+    post_count: int = Field(0, ge=0, description="Number of posts under this topic")
 
 class Post(BaseModel):
     """
@@ -58,6 +59,7 @@ class Post(BaseModel):
     content: str = Field(..., description="Post body text")
     author: Optional[str] = Field(None, description="Display name of author")
     like_count: int = Field(0, ge=0, description="Number of likes on this post")
+    comment_count: int = Field(0, ge=0, description="Number of comments on this post")
 
 class Comment(BaseModel):
     """